@@ -2,8 +2,8 @@
 # All rights reserved. This code, in full or in part, is the property of the Land Transport Authority.
 # No part of this code may be disclosed, reproduced, or distributed without prior written permission.
 
-# Last updated: 19/07/2024
-# Ver. 2.0
+# Last updated: 18/10/2026
+# Ver. 2.1
 
 # New Vehicle Price Extraction System (NVPES)
 
@@ -23,6 +23,7 @@ import os
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill, Font, Alignment
 from openpyxl.utils.dataframe import dataframe_to_rows
+from PCDS import TIMESTAMP_FORMAT, NEW_FILE_NAME, NEW_SHEET_PREFIX, load_previous_new_prices, detect_new_car_changes, write_change_log
 
 # Generate random user agents
 def generate_random_user_agent():
@@ -31,42 +32,33 @@ def generate_random_user_agent():
     return f"{random.choice(browsers)} ({random.choice(platforms)}) {random.choice(browsers)}"
 
 # Setup
-chrome_options = Options()
-chrome_options.add_argument("--headless")  
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument(f"user-agent={generate_random_user_agent()}")
-webdriver_service = Service(ChromeDriverManager().install())
-driver = webdriver.Chrome(service=webdriver_service, options=chrome_options)
-
-# Initialize lists to store the extracted data
-makes = []
-models = []
-specs = []
-prices = []
-withCOE = []
-coe_cat_list = []
-price_with_coe = []
-vehicle_types = []
-
-# List to store commercial vehicle models
-commercial_models = []
+def create_driver(driver_path=None):
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument(f"user-agent={generate_random_user_agent()}")
+    webdriver_service = Service(driver_path or ChromeDriverManager().install())
+    return webdriver.Chrome(service=webdriver_service, options=chrome_options)
 
 # Step 1: Scrape car brands
-url = "https://www.sgcarmart.com/new_cars/newcars_brand_landing.php"
-driver.get(url)
-time.sleep(1)
+def scrape_brands(driver):
+    url = "https://www.sgcarmart.com/new_cars/newcars_brand_landing.php"
+    driver.get(url)
+    time.sleep(1)
 
-brands = []
-brand_elements = driver.find_elements(By.XPATH, "//div[@id='rightside_content']//td/a")
+    brands = []
+    brand_elements = driver.find_elements(By.XPATH, "//div[@id='rightside_content']//td/a")
 
-for brand_element in brand_elements:
-    brand_text = brand_element.text
-    brand = brand_text.replace(" cars", "").strip()
-    brands.append(brand)
+    for brand_element in brand_elements:
+        brand_text = brand_element.text
+        brand = brand_text.replace(" cars", "").strip()
+        brands.append(brand)
+    return brands
 
 # Main extraction function
-def extract_data(driver, vehicle_type, coe_category=None):
+def extract_data(driver, brands, vehicle_type, coe_category=None):
+    records = []
     # Capture all relevant tables including those with different background colors
     car_tables = driver.find_elements(By.XPATH, "//table[@width='100%' and (@bgcolor='#FFFFFF' or @bgcolor='#F6FDFF')]")
     print(f"Found {len(car_tables)} car listings on the page.")
@@ -116,16 +108,19 @@ def extract_data(driver, vehicle_type, coe_category=None):
                     
                     print(f"Extracted make: {make}, model: {model}, specification: {specification}, price: {main_price}, COE: {coe_included}, bhp: {bhp_value}, COE Category: {coe_cat}")
                     
-                    # Append the data to the lists
-                    makes.append(make)
-                    models.append(model)
-                    specs.append(specification)
-                    prices.append(main_price)
-                    withCOE.append(coe_included)
-                    coe_cat_list.append(coe_cat)
-                    vehicle_types.append(vehicle_type)
+                    # Append the data to the records
+                    records.append({
+                        'Make': make,
+                        'Model': model,
+                        'Specification': specification,
+                        'Price (From SGCarMart)': main_price,
+                        'With COE': coe_included,
+                        'COE Category': coe_cat,
+                        'Vehicle Type': vehicle_type
+                    })
         except Exception as e:
             print(f"Error extracting data: {e}")
+    return records
 
 # Define URL patterns for different vehicle types
 url_patterns = {
@@ -138,48 +133,49 @@ url_patterns = {
 
 base_url = "https://www.sgcarmart.com/new_cars/newcars_listing.php"
 
-# Scrape all vehicle data with dynamic pagination
-def scrape_vehicle_data(base_url, url_patterns):
+# Split the URL patterns into independent streams of (vehicle type, params, COE category)
+def vehicle_streams(url_patterns):
+    streams = []
     for vehicle_type, params_list in url_patterns.items():
         if isinstance(params_list, list):
             for params in params_list:
-                page = 0
                 coe_category = params.split('DT=Coe')[-1][0]  # Extract 'A' or 'B'
-                while True:
-                    start = page * 60
-                    url = f"{base_url}{params}&BRSR={start}"
-                    try:
-                        driver.get(url)
-                        time.sleep(5)
-                        car_elements = driver.find_elements(By.XPATH, "//table[@width='100%' and (@bgcolor='#FFFFFF' or @bgcolor='#F6FDFF')]")
-                        if not car_elements:
-                            print(f"No data found for {vehicle_type} on page {page}. Stopping.")
-                            break
-                        extract_data(driver, vehicle_type, coe_category)
-                        page += 1
-                    except Exception as e:
-                        print(f"Error scraping data for {vehicle_type} on page {page}: {e}")
-                        break
+                streams.append((vehicle_type, params, coe_category))
         else:
-            page = 0
-            while True:
-                start = page * 60
-                url = f"{base_url}{params_list}&BRSR={start}"
-                try:
-                    driver.get(url)
-                    time.sleep(5)
-                    car_elements = driver.find_elements(By.XPATH, "//table[@width='100%' and (@bgcolor='#FFFFFF' or @bgcolor='#F6FDFF')]")
-                    if not car_elements:
-                        print(f"No data found for {vehicle_type} on page {page}. Stopping.")
-                        break
-                    extract_data(driver, vehicle_type)
-                    page += 1
-                except Exception as e:
-                    print(f"Error scraping data for {vehicle_type} on page {page}: {e}")
-                    break
+            streams.append((vehicle_type, params_list, None))
+    return streams
+
+# Scrape one stream with dynamic pagination
+def scrape_vehicle_stream(driver, brands, base_url, vehicle_type, params, coe_category=None):
+    records = []
+    page = 0
+    while True:
+        start = page * 60
+        url = f"{base_url}{params}&BRSR={start}"
+        try:
+            driver.get(url)
+            time.sleep(5)
+            car_elements = driver.find_elements(By.XPATH, "//table[@width='100%' and (@bgcolor='#FFFFFF' or @bgcolor='#F6FDFF')]")
+            if not car_elements:
+                print(f"No data found for {vehicle_type} on page {page}. Stopping.")
+                break
+            records.extend(extract_data(driver, brands, vehicle_type, coe_category))
+            page += 1
+        except Exception as e:
+            print(f"Error scraping data for {vehicle_type} on page {page}: {e}")
+            break
+    return records
+
+# Scrape all vehicle data with dynamic pagination
+def scrape_vehicle_data(driver, brands, base_url, url_patterns):
+    records = []
+    for vehicle_type, params, coe_category in vehicle_streams(url_patterns):
+        records.extend(scrape_vehicle_stream(driver, brands, base_url, vehicle_type, params, coe_category))
+    return records
 
 # Scrape commercial cars
-def extract_commercial_data(driver):
+def extract_commercial_data(driver, brands):
+    commercial_models = []
     page = 0
     while True:
         start = page * 60
@@ -208,6 +204,7 @@ def extract_commercial_data(driver):
             except Exception as e:
                 print(f"Error extracting commercial vehicle data: {e}")
         page += 1
+    return commercial_models
 
 # Scrape COE prices
 def extract_coe_prices(driver):
@@ -229,122 +226,139 @@ def extract_coe_prices(driver):
         print(f"Error extracting COE prices: {e}")
         return None, None, None, None
 
-# Perform scraping
-scrape_vehicle_data(base_url, url_patterns)
+# Combine the scraped records with the commercial models and COE prices
+def build_new_car_dataframe(records, commercial_models, coe_price_a, coe_price_b, coe_price_c):
+    for record in records:
+        # Update COE category to 'C' if model appears in both lists
+        if record['Model'] in commercial_models:
+            record['COE Category'] = 'C'
 
-# Scrape commercial vehicles
-extract_commercial_data(driver)
+        # Calculate 'Price with COE'
+        if record['With COE'] == 'Y':
+            record['Price with COE (SGD)'] = record['Price (From SGCarMart)']
+        else:
+            if record['COE Category'] == 'A':
+                record['Price with COE (SGD)'] = record['Price (From SGCarMart)'] + coe_price_a
+            elif record['COE Category'] == 'B':
+                record['Price with COE (SGD)'] = record['Price (From SGCarMart)'] + coe_price_b
+            elif record['COE Category'] == 'C':
+                record['Price with COE (SGD)'] = record['Price (From SGCarMart)'] + coe_price_c
+
+    # Create DataFrame
+    columns = ['Make', 'Model', 'Specification', 'Price (From SGCarMart)', 'With COE', 'COE Category', 'Price with COE (SGD)', 'Vehicle Type']
+    return pd.DataFrame(records, columns=columns)
+
+# Save the prices to the workbook and log changes against the previous run
+def export_new_prices(df, coe_label, coe_price_a, coe_price_b, coe_price_c):
+    # File will be saved as 'NEVC_Prices_New.xlsx' with a new sheet named by the current date and time
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    file_name = NEW_FILE_NAME
+    sheet_name = f"{NEW_SHEET_PREFIX}{timestamp}"
+
+    # Keep the previous run for change detection before the new sheet is added
+    previous_df = load_previous_new_prices(file_name, exclude_sheet=sheet_name)
+
+    # Check if the file exists
+    if os.path.exists(file_name):
+        # Load the workbook and get the existing sheets
+        book = load_workbook(file_name)
+        with pd.ExcelWriter(file_name, engine='openpyxl', mode='a') as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+    else:
+        # Create a new file
+        df.to_excel(file_name, index=False, sheet_name=sheet_name)
+
+    # Load the workbook to apply formatting
+    book = load_workbook(file_name)
+    sheet = book[sheet_name]
+
+    # Apply currency formatting
+    for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=4, max_col=4):
+        for cell in row:
+            cell.number_format = '"$"#,##0.00'
+    for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=7, max_col=7):
+        for cell in row:
+            cell.number_format = '"$"#,##0.00'
+
+    # Apply conditional formatting to 'With COE' column
+    for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=5, max_col=5):
+        for cell in row:
+            if cell.value == 'Y':
+                cell.fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
+                cell.font = Font(color='006100')
+            elif cell.value == 'N':
+                cell.fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
+                cell.font = Font(color='9C0006')
+
+    # Apply conditional formatting to 'COE Category' column
+    for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=6, max_col=6):
+        for cell in row:
+            if cell.value == 'A':
+                cell.fill = PatternFill(start_color='FFEB9C', end_color='FFEB9C', fill_type='solid')
+                cell.font = Font(color='9C5700')
+            elif cell.value == 'B':
+                cell.fill = PatternFill(start_color='F4B084', end_color='F4B084', fill_type='solid')
+                cell.font = Font(color='9C0006')
+            elif cell.value == 'C':
+                cell.fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
+                cell.font = Font(color='006100')
+
+    # Add COE prices information
+    sheet['I1'] = f"COE Car Prices as of {coe_label}" 
+    sheet['I1'].alignment = Alignment(horizontal='center')
+    sheet['I1'].font = Font(bold=True)
+    sheet['I2'] = 'Cat A (SGD)'
+    sheet['J2'] = coe_price_a
+    sheet['J2'].number_format = '"$"#,##0.00'
+    sheet['I3'] = 'Cat B (SGD)'
+    sheet['J3'] = coe_price_b
+    sheet['J3'].number_format = '"$"#,##0.00'
+    sheet['I4'] = 'Cat C (SGD)'
+    sheet['J4'] = coe_price_c
+    sheet['J4'].number_format = '"$"#,##0.00'
+
+    # Auto-adjust column widths based on the longest cell content
+    for column_cells in sheet.columns:
+        max_length = 0
+        column_letter = column_cells[0].column_letter  # Get the column letter
+        for cell in column_cells:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        adjusted_width = max_length + 2
+        sheet.column_dimensions[column_letter].width = adjusted_width
 
-# Get COE prices
-coe_label, coe_price_a, coe_price_b, coe_price_c = extract_coe_prices(driver)
+    book.save(file_name)
 
-# Update COE category to 'C' if model appears in both lists
-for i, model in enumerate(models):
-    if model in commercial_models:
-        coe_cat_list[i] = 'C'
+    print(f"Data has been saved to {file_name}")
 
-# Calculate 'Price with COE'
-for i in range(len(prices)):
-    if withCOE[i] == 'Y':
-        price_with_coe.append(prices[i])
+    # Log new, removed and price-changed models against the previous run
+    if previous_df is None:
+        print(f"Need at least two runs in {file_name} to detect new car price changes.")
     else:
-        if coe_cat_list[i] == 'A':
-            price_with_coe.append(prices[i] + coe_price_a)
-        elif coe_cat_list[i] == 'B':
-            price_with_coe.append(prices[i] + coe_price_b)
-        elif coe_cat_list[i] == 'C':
-            price_with_coe.append(prices[i] + coe_price_c)
-
-# Create DataFrame
-data = {
-    'Make': makes,
-    'Model': models,
-    'Specification': specs,
-    'Price (From SGCarMart)': prices,
-    'With COE': withCOE,
-    'COE Category': coe_cat_list,
-    'Price with COE (SGD)': price_with_coe,
-    'Vehicle Type': vehicle_types
-}
-df = pd.DataFrame(data)
+        changes = detect_new_car_changes(previous_df, df)
+        write_change_log(changes, f'NEVC_Price_Changes_New_{timestamp}.csv')
 
-# File will be saved as 'NEVC_Prices_New.xlsx' with a new sheet named by the current date and time
-timestamp = datetime.now().strftime('%d%m%y_%H%M')
-file_name = 'NEVC_Prices_New.xlsx'
-sheet_name = f"EV Prices {timestamp}"
+def main():
+    driver = create_driver()
+    try:
+        brands = scrape_brands(driver)
 
-# Check if the file exists
-if os.path.exists(file_name):
-    # Load the workbook and get the existing sheets
-    book = load_workbook(file_name)
-    with pd.ExcelWriter(file_name, engine='openpyxl', mode='a') as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-else:
-    # Create a new file
-    df.to_excel(file_name, index=False, sheet_name=sheet_name)
-
-# Load the workbook to apply formatting
-book = load_workbook(file_name)
-sheet = book[sheet_name]
-
-# Apply currency formatting
-for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=4, max_col=4):
-    for cell in row:
-        cell.number_format = '"$"#,##0.00'
-for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=7, max_col=7):
-    for cell in row:
-        cell.number_format = '"$"#,##0.00'
-
-# Apply conditional formatting to 'With COE' column
-for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=5, max_col=5):
-    for cell in row:
-        if cell.value == 'Y':
-            cell.fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
-            cell.font = Font(color='006100')
-        elif cell.value == 'N':
-            cell.fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-            cell.font = Font(color='9C0006')
-
-# Apply conditional formatting to 'COE Category' column
-for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=6, max_col=6):
-    for cell in row:
-        if cell.value == 'A':
-            cell.fill = PatternFill(start_color='FFEB9C', end_color='FFEB9C', fill_type='solid')
-            cell.font = Font(color='9C5700')
-        elif cell.value == 'B':
-            cell.fill = PatternFill(start_color='F4B084', end_color='F4B084', fill_type='solid')
-            cell.font = Font(color='9C0006')
-        elif cell.value == 'C':
-            cell.fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
-            cell.font = Font(color='006100')
-
-# Add COE prices information
-sheet['I1'] = f"COE Car Prices as of {coe_label}" 
-sheet['I1'].alignment = Alignment(horizontal='center')
-sheet['I1'].font = Font(bold=True)
-sheet['I2'] = 'Cat A (SGD)'
-sheet['J2'] = coe_price_a
-sheet['J2'].number_format = '"$"#,##0.00'
-sheet['I3'] = 'Cat B (SGD)'
-sheet['J3'] = coe_price_b
-sheet['J3'].number_format = '"$"#,##0.00'
-sheet['I4'] = 'Cat C (SGD)'
-sheet['J4'] = coe_price_c
-sheet['J4'].number_format = '"$"#,##0.00'
-
-# Auto-adjust column widths based on the longest cell content
-for column_cells in sheet.columns:
-    max_length = 0
-    column_letter = column_cells[0].column_letter  # Get the column letter
-    for cell in column_cells:
-        try:
-            if len(str(cell.value)) > max_length:
-                max_length = len(str(cell.value))
-        except:
-            pass
-    adjusted_width = max_length + 2
-    sheet.column_dimensions[column_letter].width = adjusted_width
+        # Perform scraping
+        records = scrape_vehicle_data(driver, brands, base_url, url_patterns)
+
+        # Scrape commercial vehicles
+        commercial_models = extract_commercial_data(driver, brands)
+
+        # Get COE prices
+        coe_label, coe_price_a, coe_price_b, coe_price_c = extract_coe_prices(driver)
+    finally:
+        driver.quit()
 
-book.save(file_name)
+    df = build_new_car_dataframe(records, commercial_models, coe_price_a, coe_price_b, coe_price_c)
+    export_new_prices(df, coe_label, coe_price_a, coe_price_b, coe_price_c)
 
-print(f"Data has been saved to {file_name}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# © [2024] National Electric Vehicle Centre, Land Transport Authority.
+# All rights reserved. This code, in full or in part, is the property of the Land Transport Authority.
+# No part of this code may be disclosed, reproduced, or distributed without prior written permission.
+
+# Last updated: 18/10/2026
+# Ver. 1.0
+
+# Price Change Detection System (PCDS)
+# Compares the current NVPES/UVPES run against the previous one and writes a compact change log
+# of new, removed and price-changed vehicles.
+
+import os
+import glob
+import pandas as pd
+from datetime import datetime
+
+TIMESTAMP_FORMAT = '%d%m%y_%H%M'
+
+# New cars are keyed on make+model+specification, used cars on the listing URL
+NEW_KEY_COLUMNS = ['Make', 'Model', 'Specification']
+NEW_PRICE_COLUMN = 'Price (From SGCarMart)'
+NEW_FILE_NAME = 'NEVC_Prices_New.xlsx'
+NEW_SHEET_PREFIX = 'EV Prices '
+
+USED_KEY_COLUMNS = ['Link']
+USED_INFO_COLUMNS = ['Category', 'Make', 'Model']
+USED_PRICE_COLUMN = 'Price'
+USED_FILE_PREFIX = 'NEVC_Prices_Used_'
+USED_SHEET_SUFFIX = ' Used Cars'
+
+# Join the previous and current runs on the key columns and classify each record
+def detect_changes(previous_df, current_df, key_columns, price_column, info_columns=()):
+    info_columns = [col for col in info_columns if col not in key_columns]
+    columns = key_columns + info_columns + [price_column]
+
+    current = _prepare(current_df, columns, key_columns, price_column)
+    if previous_df is None:
+        previous = current.iloc[0:0]
+    else:
+        previous = _prepare(previous_df, columns, key_columns, price_column)
+
+    # pandas merges on the key columns with a hash join, so this stays linear in the number of rows
+    merged = previous.merge(current, on=key_columns, how='outer', suffixes=('_prev', '_curr'), indicator=True)
+
+    previous_price = merged[f'{price_column}_prev']
+    current_price = merged[f'{price_column}_curr']
+    in_both = merged['_merge'] == 'both'
+    price_changed = in_both & previous_price.notna() & current_price.notna() & (previous_price != current_price)
+    # A price missing from only one run is usually a detail page that failed to load, not a price change
+    price_unavailable = in_both & (previous_price.isna() != current_price.isna())
+
+    change = pd.Series(None, index=merged.index, dtype=object)
+    change[merged['_merge'] == 'right_only'] = 'New'
+    change[merged['_merge'] == 'left_only'] = 'Removed'
+    change[price_changed] = 'Price Changed'
+    change[price_unavailable] = 'Price Unavailable'
+
+    changes = merged[key_columns].copy()
+    for col in info_columns:
+        # Prefer the current run's details, falling back to the previous run for removed records
+        changes[col] = merged[f'{col}_curr'].combine_first(merged[f'{col}_prev'])
+    changes['Change'] = change
+    changes['Previous Price (SGD)'] = previous_price
+    changes['Current Price (SGD)'] = current_price
+    changes['Price Delta (SGD)'] = current_price - previous_price
+    # A previous price of 0 has no meaningful percentage change
+    changes['Price Delta (%)'] = (changes['Price Delta (SGD)'] / previous_price.mask(previous_price == 0) * 100).round(2)
+
+    changes = changes[changes['Change'].notna()]
+    return changes.sort_values(['Change'] + key_columns, kind='stable').reset_index(drop=True)
+
+# Keep only the columns needed for the join, with normalised keys and numeric prices
+def _prepare(df, columns, key_columns, price_column):
+    df = df.copy()
+    for col in columns:
+        if col not in df.columns:
+            df[col] = None
+    df = df[columns].dropna(subset=key_columns)
+    for col in key_columns:
+        df[col] = df[col].astype(str).str.strip()
+    # Treat "NIL" details as missing so they fall back to the other run
+    for col in columns:
+        if col not in key_columns and col != price_column:
+            df[col] = df[col].replace('NIL', pd.NA)
+    # Prices can be "NIL" when a detail page failed to load
+    df[price_column] = pd.to_numeric(df[price_column], errors='coerce')
+    return df.drop_duplicates(subset=key_columns, keep='first')
+
+def detect_new_car_changes(previous_df, current_df):
+    return detect_changes(previous_df, current_df, NEW_KEY_COLUMNS, NEW_PRICE_COLUMN)
+
+def detect_used_car_changes(previous_df, current_df):
+    if previous_df is not None:
+        # Only compare the categories in the current run, so a category that was not scraped is not logged as removed
+        previous_df = previous_df[previous_df['Category'].isin(current_df['Category'].unique())]
+    return detect_changes(previous_df, current_df, USED_KEY_COLUMNS, USED_PRICE_COLUMN, USED_INFO_COLUMNS)
+
+# Load the most recent NVPES sheet, optionally skipping the sheet written by the current run
+def load_previous_new_prices(file_name=NEW_FILE_NAME, exclude_sheet=None):
+    if not os.path.exists(file_name):
+        return None
+    with pd.ExcelFile(file_name) as xls:
+        sheet_names = [name for name in xls.sheet_names if name.startswith(NEW_SHEET_PREFIX) and name != exclude_sheet]
+        if not sheet_names:
+            return None
+        # Sheets are appended in run order, so the last one is the most recent
+        return pd.read_excel(xls, sheet_name=sheet_names[-1])
+
+# Find UVPES workbooks ordered by the timestamp in their file name
+def find_used_price_files(directory='.'):
+    files = []
+    for path in glob.glob(os.path.join(directory, f'{USED_FILE_PREFIX}*.xlsx')):
+        stamp = os.path.basename(path)[len(USED_FILE_PREFIX):-len('.xlsx')]
+        try:
+            files.append((datetime.strptime(stamp, TIMESTAMP_FORMAT), path))
+        except ValueError:
+            continue
+    return [path for _, path in sorted(files)]
+
+# Combine every category sheet of a UVPES workbook into one DataFrame
+def load_used_prices(file_name):
+    sheets = pd.read_excel(file_name, sheet_name=None)
+    frames = []
+    for sheet_name, df in sheets.items():
+        df['Category'] = sheet_name.replace(USED_SHEET_SUFFIX, '')
+        frames.append(df)
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+# Load the most recent UVPES workbook, optionally skipping the one written by the current run
+def load_previous_used_prices(directory='.', exclude_file=None):
+    files = [path for path in find_used_price_files(directory) if exclude_file is None or os.path.abspath(path) != os.path.abspath(exclude_file)]
+    if not files:
+        return None
+    return load_used_prices(files[-1])
+
+# Write the change log as CSV and print a short summary
+def write_change_log(changes, file_name):
+    changes.to_csv(file_name, index=False)
+    counts = changes['Change'].value_counts()
+    print(f"New: {counts.get('New', 0)}, Removed: {counts.get('Removed', 0)}, Price Changed: {counts.get('Price Changed', 0)}, Price Unavailable: {counts.get('Price Unavailable', 0)}")
+    print(f"Change log has been saved to {file_name}")
+
+# Compare the last two runs already on disk
+if __name__ == '__main__':
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+
+    if os.path.exists(NEW_FILE_NAME):
+        with pd.ExcelFile(NEW_FILE_NAME) as xls:
+            sheet_names = [name for name in xls.sheet_names if name.startswith(NEW_SHEET_PREFIX)]
+            if len(sheet_names) >= 2:
+                previous_df = pd.read_excel(xls, sheet_name=sheet_names[-2])
+                current_df = pd.read_excel(xls, sheet_name=sheet_names[-1])
+        if len(sheet_names) >= 2:
+            write_change_log(detect_new_car_changes(previous_df, current_df), f'NEVC_Price_Changes_New_{timestamp}.csv')
+        else:
+            print(f"Need at least two runs in {NEW_FILE_NAME} to detect new car price changes.")
+
+    used_files = find_used_price_files()
+    if len(used_files) >= 2:
+        previous_df = load_used_prices(used_files[-2])
+        current_df = load_used_prices(used_files[-1])
+        write_change_log(detect_used_car_changes(previous_df, current_df), f'NEVC_Price_Changes_Used_{timestamp}.csv')
+    else:
+        print("Need at least two UVPES workbooks to detect used car price changes.")
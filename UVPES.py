@@ -2,8 +2,8 @@
 # All rights reserved. This code, in full or in part, is the property of the Land Transport Authority.
 # No part of this code may be disclosed, reproduced, or distributed without prior written permission.
 
-# Last updated: 21/06/2024
-# Ver. 1.3
+# Last updated: 18/10/2026
+# Ver. 1.4
 
 # Used Vehicle Used Price Extraction System (UVPES)
 
@@ -25,6 +25,7 @@ from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import numbers
 import re
+from PCDS import TIMESTAMP_FORMAT, USED_FILE_PREFIX, USED_SHEET_SUFFIX, load_previous_used_prices, detect_used_car_changes, write_change_log
 
 # Generate random user agents
 def generate_random_user_agent():
@@ -33,26 +34,29 @@ def generate_random_user_agent():
     return f"{random.choice(browsers)} ({random.choice(platforms)}) {random.choice(browsers)}"
 
 # Setup
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument(f"user-agent={generate_random_user_agent()}")
-webdriver_service = Service(ChromeDriverManager().install())
-driver = webdriver.Chrome(service=webdriver_service, options=chrome_options)
+def create_driver(driver_path=None):
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument(f"user-agent={generate_random_user_agent()}")
+    webdriver_service = Service(driver_path or ChromeDriverManager().install())
+    return webdriver.Chrome(service=webdriver_service, options=chrome_options)
 
 # Scrape car brands
-url = "https://www.sgcarmart.com/new_cars/newcars_brand_landing.php"
-driver.get(url)
-time.sleep(1)
+def scrape_brands(driver):
+    url = "https://www.sgcarmart.com/new_cars/newcars_brand_landing.php"
+    driver.get(url)
+    time.sleep(1)
 
-brands = []
-brand_elements = driver.find_elements(By.XPATH, "//div[@id='rightside_content']//td/a")
+    brands = []
+    brand_elements = driver.find_elements(By.XPATH, "//div[@id='rightside_content']//td/a")
 
-for brand_element in brand_elements:
-    brand_text = brand_element.text
-    brand = brand_text.replace(" cars", "").strip()
-    brands.append(brand)
+    for brand_element in brand_elements:
+        brand_text = brand_element.text
+        brand = brand_text.replace(" cars", "").strip()
+        brands.append(brand)
+    return brands
 
 # Define URLs
 base_url = "https://www.sgcarmart.com/used_cars/listing.php"
@@ -67,7 +71,7 @@ params_list = [
 ]
 
 # Scrape car detail page
-def scrape_car_details(link, brands, max_retries=3):
+def scrape_car_details(driver, link, brands, category, max_retries=3):
     retries = 0
     while retries < max_retries:
         try:
@@ -223,106 +227,134 @@ def scrape_car_details(link, brands, max_retries=3):
                     "COE Category": "NIL"
                 }
 
-# Step 2: Scrape all car links first
-car_links_per_category = {category: [] for category, _ in params_list}
-
-for category, params in params_list:
+# Step 2: Scrape all car links for a category
+def scrape_car_links(driver, category, params):
+    category_links = []
     page = 0
     while True:
         start = page * 100
         url = base_url + params.format(start)
-        
+
         # Load the page
         driver.get(url)
-        
+
         try:
             WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.XPATH, "//a[contains(@class, 'car-model-title')]")))
             time.sleep(random.uniform(1, 2))  # Short random sleep to avoid being blocked
-            
+
             # Extract car links from the listings
             car_elements = driver.find_elements(By.XPATH, "//a[contains(@class, 'car-model-title')]")
             car_links = [element.get_attribute("href") for element in car_elements]
-            
+
             print(f"Found {len(car_links)} car listings on the page for category {category}.")
-            
+
             if not car_links:
                 print(f"No more car listings found for category {category}. Stopping.")
                 break
-            
-            car_links_per_category[category].extend(car_links)
+
+            category_links.extend(car_links)
             page += 1
         except TimeoutException:
             print(f"TimeoutException: No car listings found for category {category} on page {page}. Stopping.")
             break
 
-    print(f"Total car links scraped for category {category}: {len(car_links_per_category[category])}")
+    print(f"Total car links scraped for category {category}: {len(category_links)}")
+    return category_links
 
 # Step 3: Scrape each car link for details
-data_list_per_category = {category: [] for category, _ in params_list}
-
-for category, car_links in car_links_per_category.items():
-    for i, link in enumerate(car_links):  # Scrape all links
-        car_data = scrape_car_details(link, brands)
-        data_list_per_category[category].append(car_data)
+def scrape_links_details(driver, car_links, brands, category):
+    data_list = []
+    for link in car_links:
+        car_data = scrape_car_details(driver, link, brands, category)
+        data_list.append(car_data)
         print(f"Scraped car details for link: {link}")
+    return data_list
+
+# Save the prices to a new workbook and log changes against the previous run
+def export_used_prices(data_list_per_category):
+    # Create a new workbook
+    wb = Workbook()
+    wb.remove(wb.active)  # Remove the default sheet created with the workbook
+    used_frames = []
+    for category, data_list in data_list_per_category.items():
+        df = pd.DataFrame(data_list)
+        # Ensure that all expected columns are present in the DataFrame
+        for col in ["Make", "Model", "Price", "Depreciation (SGD)", "Registration Date", "Duration of COE Left", "Mileage (km)", "Road Tax", "Dereg Value", "OMV", "COE", "ARF", "Power (bhp)", "Power (kW)", "Number of Owners", "Link", "Engine Capacity", "Vehicle Type", "COE Category"]:
+            if col not in df.columns:
+                df[col] = "NIL"
+        df = df[["Make", "Model", "Price", "Depreciation (SGD)", "Registration Date", "Duration of COE Left", "Mileage (km)", "Road Tax", "Dereg Value", "OMV", "COE", "ARF", "Power (bhp)", "Power (kW)", "Number of Owners", "Link", "Engine Capacity", "Vehicle Type", "COE Category"]]
+        used_frames.append(df.assign(Category=category))
+
+        # Add the data to a new sheet
+        sheet_name = f"{category}{USED_SHEET_SUFFIX}"
+        ws = wb.create_sheet(title=sheet_name)
+
+        # Write the DataFrame to the sheet
+        for r_idx, row in enumerate(df.values, 1):
+            for c_idx, value in enumerate(row, 1):
+                ws.cell(row=r_idx + 1, column=c_idx, value=value)
+        for c_idx, col in enumerate(df.columns, 1):
+            ws.cell(row=1, column=c_idx, value=col)
+
+        # Apply currency formatting
+        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=3, max_col=3):
+            for cell in row:
+                cell.number_format = '"$"#,##0.00'
+        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=4, max_col=4):
+            for cell in row:
+                cell.number_format = '"$"#,##0.00'
+        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=9, max_col=12):
+            for cell in row:
+                cell.number_format = '"$"#,##0.00'
+        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=15, max_col=15):
+            for cell in row:
+                cell.number_format = numbers.FORMAT_NUMBER
+
+        # Auto-adjust column widths based on the longest cell content
+        for column_cells in ws.columns:
+            max_length = 0
+            column_letter = get_column_letter(column_cells[0].column)  # Get the column letter
+            for cell in column_cells:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(str(cell.value))
+                except:
+                    pass
+            adjusted_width = max_length + 2
+            ws.column_dimensions[column_letter].width = adjusted_width
+
+    # Save the workbook
+
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    file_name = f'{USED_FILE_PREFIX}{timestamp}.xlsx'
+
+    # Keep the previous run for change detection before the new workbook is saved
+    previous_df = load_previous_used_prices(exclude_file=file_name)
+
+    wb.save(file_name)
+
+    print(f"Data has been saved to {file_name}")
+
+    # Log new, removed and price-changed listings against the previous run
+    if previous_df is None:
+        print("Need at least two UVPES workbooks to detect used car price changes.")
+    else:
+        changes = detect_used_car_changes(previous_df, pd.concat(used_frames, ignore_index=True))
+        write_change_log(changes, f'NEVC_Price_Changes_Used_{timestamp}.csv')
+
+def main():
+    driver = create_driver()
+    try:
+        brands = scrape_brands(driver)
+
+        car_links_per_category = {category: scrape_car_links(driver, category, params) for category, params in params_list}
+
+        data_list_per_category = {category: scrape_links_details(driver, car_links, brands, category) for category, car_links in car_links_per_category.items()}
+    finally:
+        # Close the driver
+        driver.quit()
+
+    export_used_prices(data_list_per_category)
 
-# Create a new workbook
-wb = Workbook()
-wb.remove(wb.active)  # Remove the default sheet created with the workbook
-for category, data_list in data_list_per_category.items():
-    df = pd.DataFrame(data_list)
-    # Ensure that all expected columns are present in the DataFrame
-    for col in ["Make", "Model", "Price", "Depreciation (SGD)", "Registration Date", "Duration of COE Left", "Mileage (km)", "Road Tax", "Dereg Value", "OMV", "COE", "ARF", "Power (bhp)", "Power (kW)", "Number of Owners", "Link", "Engine Capacity", "Vehicle Type", "COE Category"]:
-        if col not in df.columns:
-            df[col] = "NIL"
-    df = df[["Make", "Model", "Price", "Depreciation (SGD)", "Registration Date", "Duration of COE Left", "Mileage (km)", "Road Tax", "Dereg Value", "OMV", "COE", "ARF", "Power (bhp)", "Power (kW)", "Number of Owners", "Link", "Engine Capacity", "Vehicle Type", "COE Category"]]
-    
-    # Add the data to a new sheet
-    sheet_name = f"{category} Used Cars"
-    ws = wb.create_sheet(title=sheet_name)
-    
-    # Write the DataFrame to the sheet
-    for r_idx, row in enumerate(df.values, 1):
-        for c_idx, value in enumerate(row, 1):
-            ws.cell(row=r_idx + 1, column=c_idx, value=value)
-    for c_idx, col in enumerate(df.columns, 1):
-        ws.cell(row=1, column=c_idx, value=col)
-
-    # Apply currency formatting
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=3, max_col=3):
-        for cell in row:
-            cell.number_format = '"$"#,##0.00'
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=4, max_col=4):
-        for cell in row:
-            cell.number_format = '"$"#,##0.00'
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=9, max_col=12):
-        for cell in row:
-            cell.number_format = '"$"#,##0.00'
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=15, max_col=15):
-        for cell in row:
-            cell.number_format = numbers.FORMAT_NUMBER
-
-    # Auto-adjust column widths based on the longest cell content
-    for column_cells in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column_cells[0].column)  # Get the column letter
-        for cell in column_cells:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = max_length + 2
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-# Save the workbook
-
-timestamp = datetime.now().strftime('%d%m%y_%H%M')
-file_name = f'NEVC_Prices_Used_{timestamp}.xlsx'
-
-wb.save(file_name)
-
-print(f"Data has been saved to {file_name}")
-
-# Close the driver
-driver.quit()
+if __name__ == '__main__':
+    main()
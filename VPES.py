@@ -0,0 +1,270 @@
+# © [2024] National Electric Vehicle Centre, Land Transport Authority.
+# All rights reserved. This code, in full or in part, is the property of the Land Transport Authority.
+# No part of this code may be disclosed, reproduced, or distributed without prior written permission.
+
+# Last updated: 18/10/2026
+# Ver. 1.0
+
+# Vehicle Price Extraction System (VPES)
+# Runs the NVPES and UVPES stages as one DAG on a shared, bounded pool of browsers:
+#   brands -> {new car streams, commercial crawl, used car details} -> exports
+#   COE fetch, used car links -> used car details
+# Independent stages overlap, so the run takes about as long as its longest chain of stages.
+
+import sys
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from webdriver_manager.chrome import ChromeDriverManager
+import NVPES
+import UVPES
+
+# Number of browsers open at once
+BROWSER_POOL_SIZE = 4
+
+# Number of used car detail pages scraped per task, so idle browsers can pick up the remaining links
+DETAILS_CHUNK_SIZE = 50
+
+# Bounded pool of browsers, created on first use and shared by all stages
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE):
+        self.size = size
+        self._idle = queue.Queue()
+        self._drivers = []
+        # Browsers open or being started, so a slot can be reserved without holding the lock while Chrome starts
+        self._slots = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._install_lock = threading.Lock()
+        self._driver_path = None
+
+    @contextmanager
+    def browser(self):
+        driver = self._acquire()
+        try:
+            yield driver
+        except Exception:
+            # The browser may have crashed, so replace it rather than hand it to the next stage
+            self._discard(driver)
+            raise
+        self._idle.put(driver)
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed.")
+                # Only start another browser when none is idle
+                reserved = self._idle.empty() and self._slots < self.size
+                if reserved:
+                    self._slots += 1
+            if reserved:
+                return self._create()
+            try:
+                driver = self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed.")
+            return driver
+
+    def _create(self):
+        try:
+            # Install ChromeDriver once and reuse it for every browser in the pool
+            with self._install_lock:
+                if self._driver_path is None:
+                    self._driver_path = ChromeDriverManager().install()
+            driver = NVPES.create_driver(self._driver_path)
+        except Exception:
+            with self._lock:
+                self._slots -= 1
+            raise
+        with self._lock:
+            if not self._closed:
+                self._drivers.append(driver)
+                return driver
+        # The pool was closed while this browser was starting
+        driver.quit()
+        raise RuntimeError("Browser pool is closed.")
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver not in self._drivers:
+                # Already quit by close()
+                return
+            self._drivers.remove(driver)
+            self._slots -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error closing browser: {e}")
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for driver in list(self._drivers):
+                try:
+                    driver.quit()
+                except Exception as e:
+                    print(f"Error closing browser: {e}")
+            self._drivers = []
+
+# Runs each stage once its dependencies have finished, passing their results as arguments
+class StageScheduler:
+    def __init__(self, pool):
+        self.pool = pool
+        # Browser stages never wait for a browser, other stages (exports) never hold one
+        self._browser_executor = ThreadPoolExecutor(max_workers=pool.size)
+        self._local_executor = ThreadPoolExecutor(max_workers=2)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    # Reserve a stage so others can depend on it before it is added
+    def stage(self, name):
+        with self._lock:
+            if name not in self._futures:
+                self._futures[name] = Future()
+            return self._futures[name]
+
+    # With partial, a failed dependency is passed as None instead of skipping the stage
+    def add(self, name, func, deps=(), uses_browser=True, partial=False):
+        future = self.stage(name)
+        dep_futures = [self.stage(dep) for dep in deps]
+        executor = self._browser_executor if uses_browser else self._local_executor
+        remaining = [len(dep_futures)]
+        remaining_lock = threading.Lock()
+
+        def launch():
+            try:
+                executor.submit(self._run, name, future, func, dep_futures, uses_browser, partial)
+            except RuntimeError:
+                # The scheduler has been shut down
+                future.cancel()
+
+        def on_dep_done(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                launch()
+
+        if not dep_futures:
+            launch()
+        for dep_future in dep_futures:
+            dep_future.add_done_callback(on_dep_done)
+        return future
+
+    def _run(self, name, future, func, dep_futures, uses_browser, partial):
+        args = []
+        for dep_future in dep_futures:
+            try:
+                args.append(dep_future.result())
+            except Exception as e:
+                # A dependency failed and has already been reported
+                if not partial:
+                    print(f"Skipping stage {name} as a stage it depends on failed.")
+                    future.set_exception(e)
+                    return
+                args.append(None)
+        try:
+            if uses_browser:
+                with self.pool.browser() as driver:
+                    result = func(driver, *args)
+            else:
+                result = func(*args)
+            future.set_result(result)
+        except Exception as e:
+            print(f"Error in stage {name}: {e}")
+            future.set_exception(e)
+
+    # Wait for the given stages, stop the executors and return the names of the stages that failed or were skipped
+    def wait(self, names):
+        for name in names:
+            try:
+                self.stage(name).result()
+            except Exception:
+                pass
+        self.shutdown()
+        with self._lock:
+            futures = list(self._futures.items())
+        return [name for name, future in futures if future.cancelled() or (future.done() and future.exception() is not None)]
+
+    # Stop the executors, with cancel dropping any stages that have not started yet
+    def shutdown(self, cancel=False):
+        self._browser_executor.shutdown(wait=not cancel, cancel_futures=cancel)
+        self._local_executor.shutdown(wait=not cancel, cancel_futures=cancel)
+
+# Split the used car links into chunks and gather their details back in order
+def schedule_used_details(scheduler, category):
+    def plan(car_links, brands):
+        chunks = [car_links[i:i + DETAILS_CHUNK_SIZE] for i in range(0, len(car_links), DETAILS_CHUNK_SIZE)]
+        chunk_names = []
+        for index, chunk in enumerate(chunks):
+            chunk_name = f'used-details-{category}-{index}'
+            scheduler.add(chunk_name, lambda driver, chunk=chunk: UVPES.scrape_links_details(driver, chunk, brands, category))
+            chunk_names.append(chunk_name)
+        scheduler.add(f'used-details-{category}', lambda *data_lists: [car_data for data_list in data_lists for car_data in data_list], deps=chunk_names, uses_browser=False)
+
+    # The details stage is only added by the plan, so pass on a failure before it gets that far
+    def on_plan_done(plan_future):
+        if plan_future.cancelled():
+            scheduler.stage(f'used-details-{category}').cancel()
+        elif plan_future.exception() is not None:
+            scheduler.stage(f'used-details-{category}').set_exception(plan_future.exception())
+
+    scheduler.add(f'used-plan-{category}', plan, deps=[f'used-links-{category}', 'brands'], uses_browser=False).add_done_callback(on_plan_done)
+
+def main():
+    pool = BrowserPool()
+    scheduler = StageScheduler(pool)
+    try:
+        scheduler.add('brands', NVPES.scrape_brands)
+        scheduler.add('coe', NVPES.extract_coe_prices)
+
+        # Used car links do not need the brands, so start them straight away
+        for category, params in UVPES.params_list:
+            scheduler.add(f'used-links-{category}', lambda driver, category=category, params=params: UVPES.scrape_car_links(driver, category, params))
+            schedule_used_details(scheduler, category)
+
+        stream_names = []
+        for index, (vehicle_type, params, coe_category) in enumerate(NVPES.vehicle_streams(NVPES.url_patterns)):
+            stream_name = f'new-stream-{index}'
+            scheduler.add(stream_name, lambda driver, brands, vehicle_type=vehicle_type, params=params, coe_category=coe_category: NVPES.scrape_vehicle_stream(driver, brands, NVPES.base_url, vehicle_type, params, coe_category), deps=['brands'])
+            stream_names.append(stream_name)
+        scheduler.add('commercial', NVPES.extract_commercial_data, deps=['brands'])
+
+        def export_new(commercial_models, coe_prices, *streams):
+            coe_label, coe_price_a, coe_price_b, coe_price_c = coe_prices
+            records = [record for stream in streams for record in stream]
+            df = NVPES.build_new_car_dataframe(records, commercial_models, coe_price_a, coe_price_b, coe_price_c)
+            NVPES.export_new_prices(df, coe_label, coe_price_a, coe_price_b, coe_price_c)
+
+        # Export the categories that were fully scraped, a failed category is None
+        def export_used(*data_lists):
+            data_list_per_category = {}
+            for (category, _), data_list in zip(UVPES.params_list, data_lists):
+                if data_list is None:
+                    print(f"Used car details for category {category} failed and will not be exported.")
+                else:
+                    data_list_per_category[category] = data_list
+            if not data_list_per_category:
+                raise RuntimeError("No used car category was scraped successfully.")
+            UVPES.export_used_prices(data_list_per_category)
+
+        scheduler.add('export-new', export_new, deps=['commercial', 'coe'] + stream_names, uses_browser=False)
+        scheduler.add('export-used', export_used, deps=[f'used-details-{category}' for category, _ in UVPES.params_list], uses_browser=False, partial=True)
+
+        failed_stages = scheduler.wait(['export-new', 'export-used'])
+    finally:
+        # Stop queued stages first so none of them start a browser after the pool is closed
+        scheduler.shutdown(cancel=True)
+        pool.close()
+
+    if failed_stages:
+        print(f"Stages failed or skipped: {', '.join(failed_stages)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()